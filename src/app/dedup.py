@@ -0,0 +1,221 @@
+import datetime
+import difflib
+import fcntl
+import hashlib
+import json
+import os
+import random
+import re
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+NUM_PERM = 128
+SHINGLE_SIZE = 5
+
+OUTCOMES = ("miss", "exact", "near", "fallback")
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+_rng = random.Random(1)
+_PERMUTATIONS = [
+    (_rng.randint(1, _MERSENNE_PRIME - 1), _rng.randint(0, _MERSENNE_PRIME - 1))
+    for _ in range(NUM_PERM)
+]
+
+
+def shingles(document_html: str) -> set[str]:
+    """Word shingles over the visible text of an HTML document."""
+    text = BeautifulSoup(document_html, "html.parser").get_text(" ")
+    tokens = re.findall(r"\w+", text.lower())
+    return {
+        " ".join(tokens[i : i + SHINGLE_SIZE])
+        for i in range(max(len(tokens) - SHINGLE_SIZE + 1, 1))
+    }
+
+
+def minhash(document_html: str) -> list[int]:
+    """MinHash signature of an HTML document."""
+    hashes = [
+        int.from_bytes(
+            hashlib.blake2b(shingle.encode(), digest_size=4).digest(), "little"
+        )
+        for shingle in shingles(document_html)
+    ]
+    return [
+        min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+        for a, b in _PERMUTATIONS
+    ]
+
+
+def content_hash(document_html: str) -> str:
+    return hashlib.sha256(document_html.encode()).hexdigest()
+
+
+def similarity(signature: list[int], other: list[int]) -> float:
+    """Estimated Jaccard similarity of two MinHash signatures."""
+    return sum(x == y for x, y in zip(signature, other)) / len(signature)
+
+
+def html_diff(old_html: str, new_html: str) -> str:
+    """Unified line diff between two tidied HTML documents."""
+    return "\n".join(
+        difflib.unified_diff(
+            old_html.splitlines(), new_html.splitlines(), lineterm="", n=2
+        )
+    )
+
+
+def diff_ratio(old_html: str, new_html: str) -> float:
+    """Share of changed lines between two HTML documents, between 0 and 1.
+
+    A replaced block counts as the larger of its old and new line spans,
+    so a modified line is counted once rather than as a removal plus an
+    addition.
+    """
+    old_lines, new_lines = old_html.splitlines(), new_html.splitlines()
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    changed = sum(
+        max(i2 - i1, j2 - j1)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != "equal"
+    )
+    return changed / max(len(old_lines), len(new_lines), 1)
+
+
+def apply_edits(markdown: str, edits: list[tuple[str, str]]) -> str:
+    """Apply (old, new) replacements, each old fragment must occur exactly once."""
+    for old, new in edits:
+        if markdown.count(old) != 1:
+            raise ValueError(f"Edit fragment does not occur exactly once: {old!r}")
+        markdown = markdown.replace(old, new)
+    return markdown
+
+
+def _lsh_params(threshold: float) -> tuple[int, int]:
+    """Number of bands and rows whose S-curve midpoint is closest to threshold."""
+    candidates = [
+        (bands, NUM_PERM // bands)
+        for bands in range(1, NUM_PERM + 1)
+        if NUM_PERM % bands == 0
+    ]
+    return min(
+        candidates,
+        key=lambda params: abs((1 / params[0]) ** (1 / params[1]) - threshold),
+    )
+
+
+class MinHashIndex:
+    """LSH index of MinHash signatures of processed documents."""
+
+    def __init__(self, path: Path, threshold: float):
+        self.path = path
+        self.threshold = threshold
+        self.bands, self.rows = _lsh_params(threshold)
+        self.signatures: dict[str, list[int]] = {}
+        self.hashes: dict[str, str] = {}
+        self.stats: dict[str, dict[str, int]] = {}
+        self._buckets: dict[tuple, set[str]] = {}
+
+        if path.exists():
+            try:
+                self._load()
+            except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+                print(f"Ignoring corrupt near-duplicate index {path}: {e!r}")
+                self.signatures, self.hashes, self.stats = {}, {}, {}
+                self._buckets = {}
+
+    def _load(self):
+        with open(self.path) as f:
+            data = json.load(f)
+        self.stats = {
+            day: {outcome: int(counts.get(outcome, 0)) for outcome in OUTCOMES}
+            for day, counts in data["stats"].items()
+        }
+        for name, entry in data["documents"].items():
+            self.add(name, [int(x) for x in entry["signature"]], entry["sha256"])
+
+    def _band_keys(self, signature: list[int]):
+        for band in range(self.bands):
+            yield band, tuple(signature[band * self.rows : (band + 1) * self.rows])
+
+    def add(self, name: str, signature: list[int], sha256: str):
+        self.remove(name)
+        self.signatures[name] = signature
+        self.hashes[name] = sha256
+        for key in self._band_keys(signature):
+            self._buckets.setdefault(key, set()).add(name)
+
+    def remove(self, name: str):
+        signature = self.signatures.pop(name, None)
+        self.hashes.pop(name, None)
+        if signature is None:
+            return
+        for key in self._band_keys(signature):
+            self._buckets[key].discard(name)
+
+    def query(self, signature: list[int], exclude: str | None = None):
+        """Indexed documents similar to the signature, most similar first."""
+        candidates = set()
+        for key in self._band_keys(signature):
+            candidates |= self._buckets.get(key, set())
+        candidates.discard(exclude)
+
+        scored = [
+            (name, similarity(signature, self.signatures[name])) for name in candidates
+        ]
+        return sorted(
+            [(name, score) for name, score in scored if score >= self.threshold],
+            key=lambda x: (-x[1], x[0]),
+        )
+
+    def record(self, outcome: str, day: str | None = None):
+        day = day or datetime.date.today().isoformat()
+        counts = self.stats.setdefault(day, dict.fromkeys(OUTCOMES, 0))
+        counts[outcome] += 1
+
+    def counts(self, day: str | None = None) -> dict[str, int]:
+        """Lookup outcomes of a single day, or of all days if day is None."""
+        if day is not None:
+            return self.stats.get(day, dict.fromkeys(OUTCOMES, 0))
+        return {
+            outcome: sum(counts[outcome] for counts in self.stats.values())
+            for outcome in OUTCOMES
+        }
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            mode="w", dir=self.path.parent, suffix=".tmp", delete=False
+        ) as f:
+            try:
+                json.dump(
+                    {
+                        "stats": self.stats,
+                        "documents": {
+                            name: {"signature": signature, "sha256": self.hashes[name]}
+                            for name, signature in self.signatures.items()
+                        },
+                    },
+                    f,
+                )
+                f.flush()
+                os.fsync(f.fileno())
+            except BaseException:
+                os.unlink(f.name)
+                raise
+        os.replace(f.name, self.path)
+
+
+@contextmanager
+def locked_index(path: Path, threshold: float):
+    """Load the index under an exclusive file lock and save it on exit."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_suffix(".lock"), mode="w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        index = MinHashIndex(path, threshold)
+        yield index
+        index.save()
@@ -1,14 +1,25 @@
 import re
 from pathlib import Path
+from typing import Literal
 
 from langchain.output_parsers import (
     PydanticOutputParser,
 )
 from langchain.prompts import PromptTemplate
+from langchain_core.exceptions import OutputParserException
 from langgraph.graph import StateGraph
 from typing_extensions import TypedDict
 
 from app.callbacks import callbacks
+from app.dedup import (
+    MinHashIndex,
+    apply_edits,
+    content_hash,
+    diff_ratio,
+    html_diff,
+    locked_index,
+    minhash,
+)
 from app.graph.swarm import swarm
 from app.llm import llm, model
 from app.schemas import ItemList
@@ -21,6 +32,126 @@ class GraphState(TypedDict):
     items_markdown: str | None
     output_dir: Path
     output_filename: str
+    document_signature: list[int] | None
+    document_sha256: str | None
+    duplicate_filename: str | None
+    duplicate_similarity: float | None
+    duplicate_diff: str | None
+    dedup_outcome: Literal["miss", "exact", "near", "fallback"] | None
+
+
+def _index_path(output_dir: Path) -> Path:
+    return output_dir / "index" / (model + ".json")
+
+
+def load_index(output_dir: Path) -> MinHashIndex:
+    return MinHashIndex(_index_path(output_dir), settings.DEDUP_THRESHOLD)
+
+
+def _extract_markdown(text: str) -> str:
+    pattern = r"```markdown\s*(.*?)\s*```"
+    match = re.search(pattern, text, re.DOTALL)
+    if match is None:
+        raise ValueError("LLM response does not contain a markdown code block!")
+    return match.group(1).strip()
+
+
+def find_duplicate(state: GraphState) -> GraphState:
+    result = {
+        "document_signature": None,
+        "document_sha256": None,
+        "duplicate_filename": None,
+        "duplicate_similarity": None,
+        "duplicate_diff": None,
+        "dedup_outcome": None,
+    }
+    if not settings.ENABLE_DEDUP:
+        return result  # type: ignore
+
+    output_dir = state["output_dir"]
+    document_html: str = state["document_html"]  # type: ignore
+    signature = minhash(document_html)
+    sha256 = content_hash(document_html)
+    result.update(
+        {
+            "document_signature": signature,
+            "document_sha256": sha256,
+            "dedup_outcome": "miss",
+        }
+    )
+
+    index = load_index(output_dir)
+    candidates = []
+    for name, score in index.query(signature, exclude=state["output_filename"]):
+        html_path = output_dir / "html" / (name + ".html")
+        md_path = output_dir / "md" / model / (name + ".md")
+        items_path = output_dir / "items" / model / (name + ".json")
+        if not (html_path.exists() and md_path.exists() and items_path.exists()):
+            continue
+
+        # The HTML may have been overwritten by a later, failed run
+        with open(html_path) as f:
+            duplicate_html = f.read()
+        if content_hash(duplicate_html) != index.hashes[name]:
+            continue
+
+        candidates.append((name, score, duplicate_html))
+
+    # MinHash estimates of an exact and a near copy can tie, so prefer the hash
+    for name, score, _ in candidates:
+        if index.hashes[name] == sha256:
+            result.update(
+                {
+                    "duplicate_filename": name,
+                    "duplicate_similarity": score,
+                    "dedup_outcome": "exact",
+                }
+            )
+            return result  # type: ignore
+
+    for name, score, duplicate_html in candidates:
+        if diff_ratio(duplicate_html, document_html) <= settings.DEDUP_MAX_DIFF_RATIO:
+            result.update(
+                {
+                    "duplicate_filename": name,
+                    "duplicate_similarity": score,
+                    "duplicate_diff": html_diff(duplicate_html, document_html),
+                    "dedup_outcome": "near",
+                }
+            )
+            return result  # type: ignore
+
+    if candidates:
+        name, score, _ = candidates[0]
+        result.update(
+            {
+                "duplicate_filename": name,
+                "duplicate_similarity": score,
+                "dedup_outcome": "fallback",
+            }
+        )
+
+    return result  # type: ignore
+
+
+def route_duplicate(state: GraphState) -> str:
+    if state["dedup_outcome"] == "exact":
+        return "reuse_items"
+    if state["dedup_outcome"] == "near":
+        return "patch_markdown"
+    return "validate_content"
+
+
+def route_patch_markdown(state: GraphState) -> str:
+    if state["dedup_outcome"] == "fallback":
+        return "validate_content"
+    return "patch_items"
+
+
+def route_patch_items(state: GraphState) -> str | list[str]:
+    if state["dedup_outcome"] == "fallback":
+        return "validate_content"
+    return ["save_markdown", "index_document"]
 
 
 def validate_content(state: GraphState) -> GraphState:
@@ -68,12 +199,119 @@ def conv_markdown(state: GraphState) -> GraphState:
     chain = prompt | llm
     result = chain.invoke({"document_html": state["document_html"]})
 
-    pattern = r"```markdown\s*(.*?)\s*```"
-    match = re.search(pattern, result.text(), re.DOTALL)
-    if match is not None:
-        content = match.group(1).strip()
+    return {"document_markdown": _extract_markdown(result.text())}  # type: ignore
+
+
+def patch_markdown(state: GraphState) -> GraphState:
+    from pydantic import BaseModel, Field
+
+    class MarkdownEdit(BaseModel):
+        """Replacement of a Markdown fragment."""
+
+        old: str = Field(..., description="Exact fragment of the original Markdown")
+        new: str = Field(..., description="Replacement for the fragment")
+
+    class MarkdownPatch(BaseModel):
+        """Edits that bring the Markdown in line with the edited document."""
+
+        edits: list[MarkdownEdit] = Field(...)
+
+    parser = PydanticOutputParser(pydantic_object=MarkdownPatch)
+    prompt = PromptTemplate(
+        template=(
+            "The following Markdown was converted from an HTML document. "
+            "The HTML document was then edited as described by the unified diff below. "
+            "List the edits of the Markdown that reflect the changes in the diff. "
+            "Each fragment to replace must be copied exactly from the Markdown "
+            "and occur in it only once.\n\n"
+            "```markdown\n"
+            "{document_markdown}\n"
+            "```\n\n"
+            "```diff\n"
+            "{duplicate_diff}\n"
+            "```\n"
+            "{format_instructions}"
+        ),
+        input_variables=["document_markdown", "duplicate_diff"],
+        partial_variables={"format_instructions": parser.get_format_instructions()},
+    )
+
+    with open(
+        state["output_dir"] / "md" / model / (state["duplicate_filename"] + ".md")  # type: ignore
+    ) as f:
+        document_markdown = f.read()
+
+    chain = prompt | llm | parser
+    try:
+        result = chain.invoke(
+            {
+                "document_markdown": document_markdown,
+                "duplicate_diff": state["duplicate_diff"],
+            }
+        )
+        document_markdown = apply_edits(
+            document_markdown, [(edit.old, edit.new) for edit in result.edits]
+        )
+    except (OutputParserException, ValueError):
+        return {"dedup_outcome": "fallback"}  # type: ignore
+
+    return {"document_markdown": document_markdown}  # type: ignore
+
+
+def patch_items(state: GraphState) -> GraphState:
+    parser = PydanticOutputParser(pydantic_object=ItemList)
+    prompt = PromptTemplate(
+        template=(
+            "The following items were extracted from a procurement technical specification. "
+            "The specification was then edited as described by the unified diff of its HTML below. "
+            "Update the items so that they reflect the edited specification.\n\n"
+            "```json\n"
+            "{items}\n"
+            "```\n\n"
+            "```diff\n"
+            "{duplicate_diff}\n"
+            "```\n"
+            "{format_instructions}"
+        ),
+        input_variables=["items", "duplicate_diff"],
+        partial_variables={"format_instructions": parser.get_format_instructions()},
+    )
 
-    return {"document_markdown": content}  # type: ignore
+    output_dir = state["output_dir"]
+    with open(
+        output_dir / "items" / model / (state["duplicate_filename"] + ".json")  # type: ignore
+    ) as f:
+        items = f.read()
+
+    chain = prompt | llm | parser
+    try:
+        result = chain.invoke(
+            {"items": items, "duplicate_diff": state["duplicate_diff"]}
+        )
+    except OutputParserException:
+        return {"dedup_outcome": "fallback"}  # type: ignore
+
+    write_path = output_dir / "items" / model / (state["output_filename"] + ".json")
+    with open(write_path, mode="w") as f:
+        f.write(result.model_dump_json(indent=2, by_alias=True))
+
+    return {}  # type: ignore
+
+
+def reuse_items(state: GraphState) -> GraphState:
+    output_dir = state["output_dir"]
+    duplicate_filename: str = state["duplicate_filename"]  # type: ignore
+
+    with open(output_dir / "md" / model / (duplicate_filename + ".md")) as f:
+        document_markdown = f.read()
+    with open(output_dir / "items" / model / (duplicate_filename + ".json")) as f:
+        items = f.read()
+
+    write_path = output_dir / "items" / model / (state["output_filename"] + ".json")
+    with open(write_path, mode="w") as f:
+        f.write(items)
+
+    return {"document_markdown": document_markdown}  # type: ignore
 
 
 def save_markdown(state: GraphState) -> GraphState:
@@ -120,6 +358,21 @@ def parse_items(state: GraphState) -> GraphState:
     return {}  # type: ignore
 
 
+def index_document(state: GraphState) -> GraphState:
+    if settings.ENABLE_DEDUP:
+        with locked_index(
+            _index_path(state["output_dir"]), settings.DEDUP_THRESHOLD
+        ) as index:
+            index.add(
+                state["output_filename"],
+                state["document_signature"],  # type: ignore
+                state["document_sha256"],  # type: ignore
+            )
+            index.record(state["dedup_outcome"])  # type: ignore
+
+    return {}  # type: ignore
+
+
 if settings.ENABLE_REVIEWER:
 
     def call_swarm(state: GraphState):
@@ -144,31 +397,53 @@ if settings.ENABLE_REVIEWER:
 
     workflow = StateGraph(GraphState)
 
+    workflow.add_node("find_duplicate", find_duplicate)
     workflow.add_node("validate_content", validate_content)
     workflow.add_node("conv_markdown", conv_markdown)
+    workflow.add_node("patch_markdown", patch_markdown)
+    workflow.add_node("patch_items", patch_items)
+    workflow.add_node("reuse_items", reuse_items)
     workflow.add_node("save_markdown", save_markdown)
     workflow.add_node("call_swarm", call_swarm)
     workflow.add_node("parse_items", parse_items)
+    workflow.add_node("index_document", index_document)
 
+    workflow.add_conditional_edges("find_duplicate", route_duplicate)
     workflow.add_edge("validate_content", "conv_markdown")
     workflow.add_edge("conv_markdown", "save_markdown")
     workflow.add_edge("conv_markdown", "call_swarm")
+    workflow.add_conditional_edges("patch_markdown", route_patch_markdown)
+    workflow.add_conditional_edges("patch_items", route_patch_items)
+    workflow.add_edge("reuse_items", "save_markdown")
+    workflow.add_edge("reuse_items", "index_document")
     workflow.add_edge("call_swarm", "parse_items")
+    workflow.add_edge("parse_items", "index_document")
 
-    workflow.set_entry_point("validate_content")
+    workflow.set_entry_point("find_duplicate")
 
 else:
     workflow = StateGraph(GraphState)
 
+    workflow.add_node("find_duplicate", find_duplicate)
     workflow.add_node("validate_content", validate_content)
     workflow.add_node("conv_markdown", conv_markdown)
+    workflow.add_node("patch_markdown", patch_markdown)
+    workflow.add_node("patch_items", patch_items)
+    workflow.add_node("reuse_items", reuse_items)
     workflow.add_node("save_markdown", save_markdown)
     workflow.add_node("parse_items", parse_items)
+    workflow.add_node("index_document", index_document)
 
+    workflow.add_conditional_edges("find_duplicate", route_duplicate)
     workflow.add_edge("validate_content", "conv_markdown")
     workflow.add_edge("conv_markdown", "save_markdown")
     workflow.add_edge("conv_markdown", "parse_items")
+    workflow.add_conditional_edges("patch_markdown", route_patch_markdown)
+    workflow.add_conditional_edges("patch_items", route_patch_items)
+    workflow.add_edge("reuse_items", "save_markdown")
+    workflow.add_edge("reuse_items", "index_document")
+    workflow.add_edge("parse_items", "index_document")
 
-    workflow.set_entry_point("validate_content")
+    workflow.set_entry_point("find_duplicate")
 
 graph = workflow.compile().with_config({"callbacks": callbacks})
@@ -1,4 +1,5 @@
 import argparse
+import datetime
 import mimetypes
 from pathlib import Path
 
@@ -6,7 +7,7 @@ import mammoth
 from bs4 import BeautifulSoup
 from tidylib import tidy_document
 
-from app.graph.workflow import graph
+from app.graph.workflow import graph, load_index
 from app.settings import settings
 
 
@@ -64,9 +65,43 @@ def main(docx_path, output_dir):
     }
 
     try:
-        _ = graph.invoke(initial_state)  # type: ignore
+        state = graph.invoke(initial_state)  # type: ignore
     except ValueError as e:
         print(e)
+        return
+
+    if settings.ENABLE_DEDUP:
+        report_dedup(state, output_dir)
+
+
+def report_dedup(state, output_dir):
+    outcome = state["dedup_outcome"]
+    if outcome == "miss":
+        print("Near-duplicate lookup: no match, processed in full")
+    else:
+        action = {
+            "exact": "reused as is",
+            "near": "patched incrementally",
+            "fallback": "could not be patched, processed in full",
+        }[outcome]
+        print(
+            f"Near-duplicate lookup: {outcome} match of {state['duplicate_filename']} "
+            f"(similarity {state['duplicate_similarity']:.1%}), {action}"
+        )
+
+    index = load_index(output_dir)
+    for label, counts in [
+        ("today", index.counts(datetime.date.today().isoformat())),
+        ("all time", index.counts()),
+    ]:
+        lookups = sum(counts.values())
+        hits = counts["exact"] + counts["near"]
+        print(
+            f"Near-duplicate hit rate {label}: {hits}/{lookups} "
+            f"({hits / lookups if lookups else 0:.1%}; "
+            f"exact {counts['exact']}, near {counts['near']}, "
+            f"fallback {counts['fallback']}, miss {counts['miss']})"
+        )
 
 
 if __name__ == "__main__":
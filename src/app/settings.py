@@ -1,5 +1,6 @@
 from typing import Literal
 
+from pydantic import Field
 from pydantic_settings import BaseSettings
 
 
@@ -17,6 +18,10 @@ class Settings(BaseSettings):
 
     ENABLE_REVIEWER: bool = False
 
+    ENABLE_DEDUP: bool = False
+    DEDUP_THRESHOLD: float = Field(0.9, gt=0, le=1)
+    DEDUP_MAX_DIFF_RATIO: float = Field(0.2, gt=0, le=1)
+
     class Config:
         env_file = ".env"
 
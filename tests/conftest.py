@@ -0,0 +1,4 @@
+import os
+
+# app.llm requires a key at import time, the tests never call the real model
+os.environ.setdefault("GOOGLE_API_KEY", "test")
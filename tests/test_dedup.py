@@ -0,0 +1,122 @@
+from pathlib import Path
+
+import pytest
+
+from app.dedup import (
+    MinHashIndex,
+    _lsh_params,
+    apply_edits,
+    content_hash,
+    diff_ratio,
+    html_diff,
+    locked_index,
+    minhash,
+)
+
+HTML_DIR = Path(__file__).parents[1] / "data" / "kamaz_energo" / "html"
+
+
+def read_html(name: str) -> str:
+    return (HTML_DIR / (name + ".html")).read_text()
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = MinHashIndex(tmp_path / "index.json", threshold=0.9)
+    for name in ("001", "002", "003"):
+        html = read_html(name)
+        index.add(name, minhash(html), content_hash(html))
+    return index
+
+
+def test_query_identical(index):
+    matches = index.query(minhash(read_html("001")))
+    assert matches[0] == ("001", 1.0)
+
+
+def test_query_near_identical(index):
+    html = read_html("001").replace("16063-067", "26063-067")
+    matches = index.query(minhash(html))
+    assert [name for name, _ in matches] == ["001"]
+    assert 0.9 <= matches[0][1] < 1.0
+
+    assert "+        <p><strong>Техническое задание № 26063-067" in html_diff(
+        read_html("001"), html
+    )
+    assert 0 < diff_ratio(read_html("001"), html) < 0.05
+
+
+def test_query_unrelated(index):
+    assert index.query(minhash(read_html("004"))) == []
+    assert index.query(minhash(read_html("001")), exclude="001") == []
+
+
+def test_query_orders_ties_by_name(index):
+    html = read_html("001")
+    index.add("000", minhash(html), "other")
+    assert [name for name, _ in index.query(minhash(html))] == ["000", "001"]
+
+
+def test_diff_ratio_counts_modified_lines_once():
+    old = "\n".join(f"<p>{i}</p>" for i in range(10))
+    new = old.replace("<p>3</p>", "<p>30</p>")
+    assert diff_ratio(old, new) == 0.1
+    assert diff_ratio(old, old) == 0.0
+    assert diff_ratio(old, "<p>a</p>") == 1.0
+
+
+def test_apply_edits():
+    markdown = "# Title 1\n\nQuantity: 1\n"
+    assert apply_edits(markdown, [("Title 1", "Title 2"), ("y: 1", "y: 5")]) == (
+        "# Title 2\n\nQuantity: 5\n"
+    )
+    with pytest.raises(ValueError):
+        apply_edits(markdown, [("missing", "x")])
+    with pytest.raises(ValueError):
+        apply_edits(markdown, [("1", "2")])
+
+
+@pytest.mark.parametrize(
+    "threshold, params",
+    [(0.5, (32, 4)), (0.7, (16, 8)), (0.9, (8, 16)), (1.0, (1, 128))],
+)
+def test_lsh_params(threshold, params):
+    bands, rows = _lsh_params(threshold)
+    assert (bands, rows) == params
+    assert bands * rows == 128
+
+
+def test_save_load_round_trip(index):
+    index.record("miss", day="2026-10-18")
+    index.record("near", day="2026-10-19")
+    index.record("exact", day="2026-10-19")
+    index.save()
+
+    loaded = MinHashIndex(index.path, threshold=0.9)
+    assert loaded.signatures == index.signatures
+    assert loaded.hashes == index.hashes
+    assert loaded.counts("2026-10-19") == {
+        "miss": 0,
+        "exact": 1,
+        "near": 1,
+        "fallback": 0,
+    }
+    assert loaded.counts()["miss"] == 1
+    assert loaded.query(minhash(read_html("002")))[0][0] == "002"
+
+
+def test_locked_index_saves_on_exit(tmp_path):
+    path = tmp_path / "index" / "model.json"
+    html = read_html("005")
+    with locked_index(path, threshold=0.9) as index:
+        index.add("005", minhash(html), content_hash(html))
+
+    assert "005" in MinHashIndex(path, threshold=0.9).signatures
+    assert not list(path.parent.glob("*.tmp"))
+
+
+def test_corrupt_index_is_empty(tmp_path):
+    path = tmp_path / "index.json"
+    path.write_text('{"stats": {}, "documents": {"001": {"signa')
+    index = MinHashIndex(path, threshold=0.9)
+    assert index.signatures == {} and index.counts()["miss"] == 0
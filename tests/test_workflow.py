@@ -0,0 +1,229 @@
+import json
+import shutil
+from pathlib import Path
+
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from app.dedup import content_hash, locked_index, minhash, similarity
+from app.graph import workflow
+from app.main import report_dedup
+from app.settings import settings
+
+DATA_DIR = Path(__file__).parents[1] / "data" / "kamaz_energo"
+SOURCE_MODEL = "gemini-2.5-pro"
+
+ITEMS = (DATA_DIR / "items" / SOURCE_MODEL / "001.json").read_text()
+VALID = '{"is_valid": true}'
+MARKDOWN = "```markdown\n# Converted\n```"
+
+
+def read_html(name: str) -> str:
+    return (DATA_DIR / "html" / (name + ".html")).read_text()
+
+
+def stub_llm(monkeypatch, responses: list[str]) -> list:
+    """Replace the LLM with canned responses, returns the list of prompts."""
+    prompts = []
+
+    def respond(prompt):
+        prompts.append(prompt.to_string())
+        return AIMessage(content=responses.pop(0))
+
+    monkeypatch.setattr(workflow, "llm", RunnableLambda(respond))
+    return prompts
+
+
+def add_document(output_dir: Path, name: str, html: str):
+    """Register a processed document with the outputs of 001."""
+    (output_dir / "html" / (name + ".html")).write_text(html)
+    shutil.copy(
+        DATA_DIR / "md" / SOURCE_MODEL / "001.md",
+        output_dir / "md" / workflow.model / (name + ".md"),
+    )
+    shutil.copy(
+        DATA_DIR / "items" / SOURCE_MODEL / "001.json",
+        output_dir / "items" / workflow.model / (name + ".json"),
+    )
+    with locked_index(
+        workflow._index_path(output_dir), settings.DEDUP_THRESHOLD
+    ) as index:
+        index.add(name, minhash(html), content_hash(html))
+
+
+@pytest.fixture
+def output_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "ENABLE_DEDUP", True)
+    for subdir in ("html", f"md/{workflow.model}", f"items/{workflow.model}"):
+        (tmp_path / subdir).mkdir(parents=True)
+    add_document(tmp_path, "001", read_html("001"))
+    return tmp_path
+
+
+def run(output_dir: Path, html: str, name: str = "new"):
+    (output_dir / "html" / (name + ".html")).write_text(html)
+    return workflow.graph.invoke(
+        {"document_html": html, "output_dir": output_dir, "output_filename": name}  # type: ignore
+    )
+
+
+def find(output_dir: Path, html: str, name: str = "new"):
+    return workflow.find_duplicate(
+        {"document_html": html, "output_dir": output_dir, "output_filename": name}  # type: ignore
+    )
+
+
+def read_output(output_dir: Path, kind: str, name: str = "new") -> str:
+    suffix = ".json" if kind == "items" else ".md"
+    return (output_dir / kind / workflow.model / (name + suffix)).read_text()
+
+
+def test_exact_reuses_outputs(output_dir, monkeypatch):
+    prompts = stub_llm(monkeypatch, [])
+
+    state = run(output_dir, read_html("001"))
+
+    assert state["dedup_outcome"] == "exact"
+    assert state["duplicate_filename"] == "001"
+    assert prompts == []
+    assert read_output(output_dir, "items") == read_output(output_dir, "items", "001")
+    assert read_output(output_dir, "md") == read_output(output_dir, "md", "001")
+
+    index = workflow.load_index(output_dir)
+    assert "new" in index.signatures
+    assert index.counts()["exact"] == 1
+
+
+def test_exact_wins_tie_with_near_copy(output_dir):
+    html = read_html("001")
+    near_html = html.replace("20.05.2025г.</strong>", "20.05.2026г.</strong>", 1)
+    assert near_html != html
+    assert similarity(minhash(html), minhash(near_html)) == 1.0
+
+    # Sorts before 001, so it would win the tie on similarity alone
+    add_document(output_dir, "000", near_html)
+
+    state = find(output_dir, html)
+    assert state["dedup_outcome"] == "exact"
+    assert state["duplicate_filename"] == "001"
+    assert workflow.route_duplicate(state) == "reuse_items"
+
+
+def test_near_patches_markdown_and_items(output_dir, monkeypatch):
+    html = read_html("001").replace("16063-067", "26063-067")
+    items = json.loads(ITEMS)
+    items[0]["Количество"] = 2.0
+    edits = {
+        "edits": [
+            {
+                "old": "## **Техническое задание № 16063-067",
+                "new": "## **Техническое задание № 26063-067",
+            }
+        ]
+    }
+    prompts = stub_llm(monkeypatch, [json.dumps(edits), json.dumps(items)])
+
+    state = run(output_dir, html)
+
+    assert state["dedup_outcome"] == "near"
+    assert len(prompts) == 2
+    assert "+        <p><strong>Техническое задание № 26063-067" in prompts[0]
+    assert read_output(output_dir, "md").startswith(
+        "## **Техническое задание № 26063-067"
+    )
+    assert json.loads(read_output(output_dir, "items"))[0]["Количество"] == 2.0
+    assert workflow.load_index(output_dir).counts()["near"] == 1
+
+
+@pytest.mark.parametrize(
+    "patch_responses",
+    [
+        ['{"edits": [{"old": "missing fragment", "new": "x"}]}'],
+        ["not a patch"],
+        ['{"edits": []}', "not an item list"],
+    ],
+    ids=["edit-does-not-apply", "unparsable-edits", "unparsable-items"],
+)
+def test_near_falls_back_to_full_path(output_dir, monkeypatch, patch_responses):
+    html = read_html("001").replace("16063-067", "26063-067")
+    prompts = stub_llm(monkeypatch, [*patch_responses, VALID, MARKDOWN, ITEMS])
+
+    state = run(output_dir, html)
+
+    assert state["dedup_outcome"] == "fallback"
+    assert len(prompts) == len(patch_responses) + 3
+    assert read_output(output_dir, "md") == "# Converted"
+    assert read_output(output_dir, "items") == ITEMS
+    assert workflow.load_index(output_dir).counts()["fallback"] == 1
+
+
+def test_large_diff_tries_next_candidate(output_dir):
+    html = read_html("001")
+    # Same text, so the estimate is 1.0, but most lines of the HTML differ
+    add_document(output_dir, "000", html.replace("<p>", '<p class="x">'))
+
+    state = find(output_dir, html.replace("16063-067", "26063-067"))
+    assert state["dedup_outcome"] == "near"
+    assert state["duplicate_filename"] == "001"
+
+
+def test_large_diff_falls_back(output_dir):
+    state = find(output_dir, read_html("001").replace("<p>", '<p class="x">'))
+    assert state["dedup_outcome"] == "fallback"
+    assert state["duplicate_filename"] == "001"
+    assert workflow.route_duplicate(state) == "validate_content"
+
+
+def test_unrelated_document_misses(output_dir, monkeypatch):
+    prompts = stub_llm(monkeypatch, [VALID, MARKDOWN, ITEMS])
+
+    state = run(output_dir, read_html("004"))
+
+    assert state["dedup_outcome"] == "miss"
+    assert len(prompts) == 3
+    assert workflow.load_index(output_dir).counts()["miss"] == 1
+
+
+def test_overwritten_html_is_skipped(output_dir):
+    (output_dir / "html" / "001.html").write_text(read_html("004"))
+
+    state = find(output_dir, read_html("001"))
+    assert state["dedup_outcome"] == "miss"
+    assert state["duplicate_filename"] is None
+
+
+def test_disabled(output_dir, monkeypatch):
+    monkeypatch.setattr(settings, "ENABLE_DEDUP", False)
+
+    state = find(output_dir, read_html("001"))
+    assert state["dedup_outcome"] is None
+    assert state["document_signature"] is None
+    assert workflow.route_duplicate(state) == "validate_content"
+
+
+@pytest.mark.parametrize(
+    "outcome, route_markdown, route_items",
+    [
+        ("near", "patch_items", ["save_markdown", "index_document"]),
+        ("fallback", "validate_content", "validate_content"),
+    ],
+)
+def test_patch_routes(outcome, route_markdown, route_items):
+    state = {"dedup_outcome": outcome}
+    assert workflow.route_patch_markdown(state) == route_markdown  # type: ignore
+    assert workflow.route_patch_items(state) == route_items  # type: ignore
+
+
+def test_report_dedup(output_dir, monkeypatch, capsys):
+    stub_llm(monkeypatch, [VALID, MARKDOWN, ITEMS])
+    run(output_dir, read_html("004"), name="004")
+    state = run(output_dir, read_html("001"))
+    report_dedup(state, output_dir)
+
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == (
+        "Near-duplicate lookup: exact match of 001 (similarity 100.0%), reused as is"
+    )
+    assert lines[1].startswith("Near-duplicate hit rate today: 1/2 (50.0%;")
+    assert lines[2].startswith("Near-duplicate hit rate all time: 1/2 (50.0%;")